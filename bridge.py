@@ -9,28 +9,118 @@ import sys
 import os
 import json
 import datetime
+import multiprocessing
+import queue
+import threading
 
 # Add project root to path
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from src.core.validation import PTSTMTValidator, ValidationResult
-from src.utils.data_utils import to_date, slice_num, slice_str, extract_posting_date, extract_card_number, custom_round
-import re
+from src.core.validation import ResultMerger, process_ranges, format_sequence, SEQ_CLOSED
+from src.core._scan import map_file, line_at, block_cr_totals, duplicate_lines, REC_02
+from src.utils.data_utils import parse_transaction
+
+
+# Compact encoder shared by all messages written to Electron
+encode_json = json.JSONEncoder(default=str, separators=(",", ":")).encode
+
+# (tag, payload) messages for the writer thread; None stops it
+writer_q = queue.Queue(maxsize=64)
+
+# Error raised while writing to stdout, set by the writer thread
+writer_error = None
+
+# Upper bounds for the messages coalesced into one stdout write
+WRITE_MAX_MESSAGES = 16
+WRITE_MAX_CHARS = 1024 * 1024
+
+
+def _writer(q):
+    """Encode queued messages and write them to stdout, off the validation thread.
+
+    An error (e.g. BrokenPipeError) is kept in writer_error, and the queue is
+    still drained until None so the producer never blocks on a full queue.
+    """
+    global writer_error
+    while True:
+        item = q.get()
+        if writer_error is not None:
+            if item is None:
+                return
+            continue
+        # Coalesce messages already queued into one write, up to a bounded
+        # size so rows keep flowing while the producer refills the queue
+        lines = []
+        size = 0
+        try:
+            while item is not None:
+                tag, payload = item
+                line = f"{tag}:{encode_json(payload)}\n"
+                lines.append(line)
+                size += len(line)
+                if len(lines) >= WRITE_MAX_MESSAGES or size >= WRITE_MAX_CHARS:
+                    break
+                try:
+                    item = q.get_nowait()
+                except queue.Empty:
+                    break
+            if lines:
+                sys.stdout.write("".join(lines))
+                sys.stdout.flush()
+        except Exception as e:
+            writer_error = e
+        if item is None:
+            return
+
+
+def start_writer():
+    """Start the stdout writer thread."""
+    writer = threading.Thread(target=_writer, args=(writer_q,), daemon=True)
+    writer.start()
+    return writer
+
+
+def stop_writer(writer):
+    """Wait until all queued messages are written and stop the writer thread.
+
+    Raises:
+        Exception: The error that stopped the writer from writing, if any
+    """
+    writer_q.put(None)
+    writer.join()
+    if writer_error is not None:
+        raise writer_error
+
+
+def send_message(tag, payload):
+    """Queue a message for the writer thread.
+
+    Raises:
+        Exception: The error that stopped the writer from writing, if any
+    """
+    if writer_error is not None:
+        raise writer_error
+    writer_q.put((tag, payload))
 
 
 def send_progress(processed, total):
     """Send progress update to Electron."""
     percent = int((processed / total) * 100) if total > 0 else 0
-    progress_data = {"processed": processed, "total": total, "percent": percent}
-    sys.stdout.write(f"PROGRESS:{json.dumps(progress_data)}\n")
-    sys.stdout.flush()
+    send_message("PROGRESS", {"processed": processed, "total": total, "percent": percent})
 
 
 def send_data(module, rows):
     """Send incremental data to Electron for realtime display."""
-    data_msg = {"module": module, "rows": rows}
-    sys.stdout.write(f"DATA:{json.dumps(data_msg, default=str)}\n")
-    sys.stdout.flush()
+    send_message("DATA", {"module": module, "rows": rows})
+
+
+BATCH_SIZE = 500  # Rows per DATA: message
+
+
+def send_batches(module, rows):
+    """Send rows to Electron as DATA: messages of at most BATCH_SIZE rows."""
+    for i in range(0, len(rows), BATCH_SIZE):
+        send_data(module, rows[i:i + BATCH_SIZE])
 
 
 def process_validation_realtime(params):
@@ -40,191 +130,70 @@ def process_validation_realtime(params):
     from_date_str = params.get("from_date", "2025-10-16")
     until_date_str = params.get("until_date", "2025-11-15")
 
-    from_date = datetime.datetime.strptime(from_date_str, "%Y-%m-%d").date()
-    until_date = datetime.datetime.strptime(until_date_str, "%Y-%m-%d").date()
+    # Dates come from <input type="date">, always YYYY-MM-DD
+    from_date = datetime.date.fromisoformat(from_date_str)
+    until_date = datetime.date.fromisoformat(until_date_str)
 
     # Determine target header type based on card type
-    target_header_type = "02"  # default for REGULAR
+    target_header_type = REC_02  # default for REGULAR
     if card_type == "CORPORATE":
-        target_header_type = "02"
-
-    # Count total lines
-    with open(file_path, "r", encoding="latin-1") as f:
-        total_lines = sum(1 for _ in f)
-
-    # Data collectors
-    filtered = []
-    validations = []
-    card_records = {}
-    transaction_tracker = {}
-    card_transactions = {}
-    card_tot_payment = {}
-    zero_amount_transactions = []
-    customer_sequences = {}
-
-    # State
-    current_header = None
-    current_stats = {"DR": 0, "CR": 0}
-    current_customer = None
-    current_card = None
-    processed = 0
-
-    # Batch buffer for streaming
-    val_batch = []
-    filter_batch = []
-    zero_batch = []
-    BATCH_SIZE = 5  # Send every N items
-
-    def flush_batches():
-        nonlocal val_batch, filter_batch, zero_batch
-        if val_batch:
-            send_data("validations", val_batch)
-            val_batch = []
-        if filter_batch:
-            send_data("filtered_transactions", filter_batch)
-            filter_batch = []
-        if zero_batch:
-            send_data("zero_amount_transactions", zero_batch)
-            zero_batch = []
-
-    def validate_block(header, stats, card_type_val):
-        """Validate a block and stream results immediately."""
-        card = header['card']
-        expected_new = stats["DR"] + header['prev'] + header['int'] - stats["CR"]
-        expected_new = custom_round(expected_new)
-        expected_avl = header['cr_limit'] - expected_new - header['instl']
-        expected_avl = custom_round(expected_avl)
-
-        if card_type_val == "CORPORATE":
-            expected_min_pay = expected_new
-        else:
-            expected_min_pay = custom_round(expected_new * 0.05)
-            if expected_min_pay < 50000:
-                expected_min_pay = 50000
-
-        if expected_new <= 0:
-            expected_min_pay = 0
-
-        def check(field, exp, act):
-            return {
-                "card": card, "field": field, "expected": exp,
-                "actual": act, "status": "PASS" if exp == act else "FAIL"
-            }
-
-        results = [
-            check("NEW_BAL", expected_new, header['new_bal']),
-            check("AVL_CR_LIMIT", expected_avl, header['avl_actual']),
-            check("PT_SH_MIN_PAYMENT", expected_min_pay, header['amount_due'])
-        ]
-        validations.extend(results)
-        val_batch.extend(results)
-
-    # Process file
-    with open(file_path, "r", encoding="latin-1") as f:
-        for line in f:
-            processed += 1
-
-            if processed % 1000 == 0:
-                send_progress(processed, total_lines)
-                flush_batches()
-
-            record_type = line[:2]
-
-            # Track structure
-            if record_type == "01":
-                current_customer = slice_str(line, 3, 18)
-                if current_customer not in card_records:
-                    card_records[current_customer] = set()
-                    customer_sequences[current_customer] = []
-                card_records[current_customer].add("01")
-                customer_sequences[current_customer].append("01")
-
-            if record_type == target_header_type:
-                if current_header is not None:
-                    validate_block(current_header, current_stats, card_type)
-
-                current_stats = {"DR": 0, "CR": 0}
-                current_card = slice_str(line, 28, 43)
-                current_header = {
-                    'card': current_card,
-                    'prev': slice_num(line, 324, 338),
-                    'int': slice_num(line, 399, 413),
-                    'cr_limit': slice_num(line, 279, 292),
-                    'instl': slice_num(line, 891, 900),
-                    'new_bal': slice_num(line, 414, 428),
-                    'amount_due': slice_num(line, 264, 277),
-                    'avl_actual': slice_num(line, 294, 308)
-                }
-
-                tot_payment = slice_num(line, 354, 367)
-                card_tot_payment[current_card] = tot_payment
-                card_transactions[current_card] = []
-
-                if record_type == "02" and current_customer:
-                    card_records[current_customer].add("02")
-                    customer_sequences[current_customer].append("02")
-
-            elif record_type == "03":
-                posting_date = to_date(extract_posting_date(line))
-                card_num = extract_card_number(line)
-                trx_detail = slice_str(line, 90, 129)
-                trx_amt = slice_num(line, 149, 162)
-                trx_dir = slice_str(line, 163, 164)
-
-                if posting_date < from_date or posting_date > until_date:
-                    entry = {
-                        "posting": str(posting_date),
-                        "card": card_num,
-                        "line": line.rstrip()
-                    }
-                    filtered.append(entry)
-                    filter_batch.append(entry)
-
-                # Track duplicate
-                dup_key = (card_num, str(posting_date), trx_detail, trx_amt, trx_dir)
-                transaction_tracker[dup_key] = transaction_tracker.get(dup_key, 0) + 1
-
-                # Track CR for tot_payment
-                if current_card and current_card in card_transactions:
-                    card_transactions[current_card].append({
-                        'direction': trx_dir,
-                        'amount': trx_amt
-                    })
-
-                # Track zero amount
-                if trx_amt == 0:
-                    entry = {
-                        "card": card_num,
-                        "posting_date": str(posting_date),
-                        "trx_detail": trx_detail,
-                        "amount": trx_amt,
-                        "direction": trx_dir
-                    }
-                    zero_amount_transactions.append(entry)
-                    zero_batch.append(entry)
-
-                if current_header is not None:
-                    current_stats[trx_dir] = current_stats.get(trx_dir, 0) + trx_amt
-
-                if current_customer:
-                    card_records[current_customer].add("03")
-                    customer_sequences[current_customer].append("03")
-
-            elif record_type == "04":
-                if current_customer:
-                    card_records[current_customer].add("04")
-                    customer_sequences[current_customer].append("04")
-
-            # Flush batches periodically
-            if len(val_batch) >= BATCH_SIZE or len(filter_batch) >= BATCH_SIZE or len(zero_batch) >= BATCH_SIZE:
-                flush_batches()
+        target_header_type = REC_02
+
+    # Progress is reported in bytes so the file is only read once
+    total_bytes = os.path.getsize(file_path)
+
+    # Validation, filtered and zero amount rows are only streamed; the
+    # final result carries their counts
+    validation_counts = {"PASS": 0, "FAIL": 0}
+    filtered_count = zero_amount_count = 0
+
+    def send_validations(rows):
+        """Count validation rows and stream them."""
+        for row in rows:
+            validation_counts[row["status"]] += 1
+        send_batches("validations", rows)
+
+    # Ranges of the file are validated in order (in parallel for large
+    # files); stream the rows of each one as soon as it is merged
+    merger = ResultMerger(card_type, keep_rows=False)
+    for part in process_ranges(file_path, card_type, target_header_type,
+                               from_date, until_date, send_progress, format_dates=True):
+        send_validations(merger.add(part))
+        send_batches("filtered_transactions", part.filtered_transactions)
+        send_batches("zero_amount_transactions", part.zero_amount_transactions)
+        filtered_count += len(part.filtered_transactions)
+        zero_amount_count += len(part.zero_amount_transactions)
 
     # Validate last block
-    if current_header is not None:
-        validate_block(current_header, current_stats, card_type)
-        flush_batches()
+    send_validations(merger.finish())
+
+    card_records = merger.card_records
+    card_blocks = merger.card_blocks
+    block_tot_payment = merger.block_tot_payment
+    customer_sequences = merger.customer_sequences
+    customer_states = merger.customer_states
+
+    # Duplicate lines are re-read from the mapped file
+    with open(file_path, "rb") as f, map_file(f) as buf:
+        duplicate_transactions = []
+        date_strs = {}  # posting date -> str; statements share few dates
+        dup_offsets, dup_counts = duplicate_lines(merger.trx_keys, merger.trx_offsets)
+        for offset, count in zip(dup_offsets.tolist(), dup_counts.tolist()):
+            card_num, posting_date, trx_detail, trx_amt, trx_dir = \
+                parse_transaction(line_at(buf, offset))
+            posting_str = date_strs.get(posting_date)
+            if posting_str is None:
+                posting_str = date_strs[posting_date] = str(posting_date)
+            duplicate_transactions.append({
+                "card": card_num,
+                "posting_date": posting_str,
+                "trx_detail": trx_detail,
+                "amount": trx_amt,
+                "direction": trx_dir,
+                "count": count
+            })
 
-    send_progress(total_lines, total_lines)
+    send_progress(total_bytes, total_bytes)
 
     # Generate post-processing results and stream them
     # Structure results
@@ -244,27 +213,17 @@ def process_validation_realtime(params):
     send_data("structure_results", structure_results)
 
     # Duplicate results
-    duplicate_transactions = []
-    for key, count in transaction_tracker.items():
-        if count > 1:
-            card_num, posting_date, trx_detail, trx_amt, trx_dir = key
-            duplicate_transactions.append({
-                "card": card_num,
-                "posting_date": posting_date,
-                "trx_detail": trx_detail,
-                "amount": trx_amt,
-                "direction": trx_dir,
-                "count": count
-            })
     send_data("duplicate_transactions", duplicate_transactions)
 
     # Tot payment results
     tot_payment_results = []
-    for card, tot_payment in card_tot_payment.items():
-        transactions = card_transactions.get(card, [])
-        cr_transactions = [t for t in transactions if t['direction'] == 'CR']
-        has_cr = len(cr_transactions) > 0
-        cr_total = sum(t['amount'] for t in cr_transactions)
+    block_has_cr, block_cr_total = block_cr_totals(
+        merger.trx_blocks, merger.trx_amounts, merger.trx_is_cr, len(block_tot_payment))
+    block_has_cr = block_has_cr.tolist()
+    block_cr_total = block_cr_total.tolist()
+    for card, block in card_blocks.items():
+        tot_payment = block_tot_payment[block]
+        has_cr = block_has_cr[block]
         if has_cr and tot_payment == 0:
             status = "INVALID"
         else:
@@ -273,20 +232,18 @@ def process_validation_realtime(params):
             "card": card,
             "tot_payment": tot_payment,
             "has_cr": "Yes" if has_cr else "No",
-            "cr_total": cr_total,
+            "cr_total": block_cr_total[block],
             "status": status
         })
     send_data("tot_payment_results", tot_payment_results)
 
     # Sequence results
-    pattern = re.compile(r"^01(02(03)*04)((02|03)(03)*04)*$")
     sequence_results = []
     for customer, seq in customer_sequences.items():
-        seq_str = "".join(seq)
-        status = "VALID" if pattern.match(seq_str) else "INVALID"
+        status = "VALID" if customer_states[customer] == SEQ_CLOSED else "INVALID"
         sequence_results.append({
             "customer": customer,
-            "sequence": "->".join(seq),
+            "sequence": format_sequence(seq),
             "status": status
         })
     send_data("sequence_results", sequence_results)
@@ -295,11 +252,11 @@ def process_validation_realtime(params):
     return {
         "success": True,
         "data": {
-            "validations": validations,
-            "filtered_transactions": filtered,
+            "validations_summary": validation_counts,
+            "filtered_transactions_count": filtered_count,
+            "zero_amount_transactions_count": zero_amount_count,
             "structure_results": structure_results,
             "duplicate_transactions": duplicate_transactions,
-            "zero_amount_transactions": zero_amount_transactions,
             "tot_payment_results": tot_payment_results,
             "sequence_results": sequence_results
         }
@@ -307,22 +264,31 @@ def process_validation_realtime(params):
 
 
 def main():
+    writer = start_writer()
     try:
         input_data = sys.stdin.read()
         params = json.loads(input_data.strip())
 
         result = process_validation_realtime(params)
 
-        # Final JSON output
-        print(json.dumps(result, default=str))
+        # Final JSON output, after all streamed messages
+        stop_writer(writer)
+        print(encode_json(result))
     except Exception as e:
+        try:
+            stop_writer(writer)
+        except Exception:
+            # Report the validation error even if the writer failed too
+            pass
         error_result = {
             "success": False,
             "error": str(e)
         }
-        print(json.dumps(error_result))
+        print(encode_json(error_result))
         sys.exit(1)
 
 
 if __name__ == "__main__":
+    # Needed for the worker processes of the frozen (PyInstaller) build
+    multiprocessing.freeze_support()
     main()
@@ -105,11 +105,14 @@ ipcMain.handle("run-validation", async (event, params) => {
 
     let stdout = "";
     let stderr = "";
+    let pending = "";
 
+    pythonProcess.stdout.setEncoding("utf8");
     pythonProcess.stdout.on("data", (data) => {
-      const text = data.toString();
+      // Messages can span several chunks; keep the incomplete last line
+      const lines = (pending + data).split("\n");
+      pending = lines.pop();
       // Check for progress and data updates
-      const lines = text.split("\n");
       for (const line of lines) {
         if (line.startsWith("PROGRESS:")) {
           const progressData = JSON.parse(line.substring(9));
@@ -129,6 +132,7 @@ ipcMain.handle("run-validation", async (event, params) => {
 
     pythonProcess.on("close", (code) => {
       pythonProcess = null;
+      stdout += pending;
       if (code === 0) {
         try {
           const result = JSON.parse(stdout);
@@ -381,8 +381,9 @@ async function startProcessing() {
     });
     
     if (result.success) {
-      // Use final result to ensure completeness (overwrites streamed data)
-      state.allData = result.data;
+      // Validation, filtered and zero amount rows only arrive as streamed data;
+      // the final result replaces the other modules and adds their counts
+      Object.assign(state.allData, result.data);
       updateProgress(100);
       if (state.currentModule === 'dashboard') {
         renderDashboard();
@@ -0,0 +1,335 @@
+"""
+Record Scanner for StatementGuard
+Locates PTSTMT records in a file buffer with NumPy, so the per-line Python
+loop only has to deal with field extraction.
+"""
+
+import contextlib
+import mmap
+import os
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from src.utils.data_utils import LATIN1_WHITESPACE
+
+NEWLINE = 0x0A
+MINUS = 0x2D
+ZERO = 0x30
+
+# Padding bytes, the same set parse_num strips
+WHITESPACE = np.frombuffer(LATIN1_WHITESPACE, dtype=np.uint8)
+
+# Lines gathered per step by field_column()
+GATHER_CHUNK = 65536
+
+
+def record_code(record_type: str) -> int:
+    """Convert a 2-character record type to the integer code used by scan().
+
+    Args:
+        record_type: Record type prefix, e.g. "02"
+
+    Returns:
+        int: Record type code
+    """
+    return ord(record_type[0]) << 8 | ord(record_type[1])
+
+
+REC_01 = record_code("01")
+REC_02 = record_code("02")
+REC_03 = record_code("03")
+REC_04 = record_code("04")
+
+
+def map_file(f):
+    """Memory-map an open binary file for read-only scanning.
+
+    Args:
+        f: File object opened in binary mode
+
+    Returns:
+        Context manager yielding the mapped buffer (b"" for an empty file,
+        which cannot be mapped)
+    """
+    if os.fstat(f.fileno()).st_size == 0:
+        return contextlib.nullcontext(b"")
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def shard_bounds(buf, n_shards: int) -> List[Tuple[int, int]]:
+    """Split a PTSTMT buffer into byte ranges that each start at a 01 record.
+
+    Args:
+        buf: File contents
+        n_shards: Desired number of ranges
+
+    Returns:
+        List of (start, stop) offsets covering the whole buffer, in order.
+        Fewer than n_shards ranges are returned when 01 records are sparse.
+    """
+    size = len(buf)
+    bounds = [0]
+    for i in range(1, n_shards):
+        pos = buf.find(b"\n01", max(size * i // n_shards - 1, bounds[-1]))
+        if pos == -1:
+            break
+        bounds.append(pos + 1)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def scan(buf, start: int = 0, stop: int = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Split a PTSTMT buffer into records.
+
+    Args:
+        buf: File contents (bytes or any object supporting the buffer protocol)
+        start: Offset of the first line to scan
+        stop: Offset just past the last line to scan (default: end of buf)
+
+    Returns:
+        Tuple of (starts, ends, record_types) arrays, one entry per line.
+        Offsets are relative to buf; ends are exclusive and include the
+        trailing newline; record_types holds record_code() of the first two
+        bytes, or -1 for shorter lines.
+    """
+    if stop is None:
+        stop = len(buf)
+    data = np.frombuffer(buf, dtype=np.uint8, count=stop - start, offset=start)
+
+    ends = np.flatnonzero(data == NEWLINE) + 1
+    if data.size and (ends.size == 0 or ends[-1] != data.size):
+        # Last line without trailing newline
+        ends = np.append(ends, data.size)
+    starts = np.concatenate(([0], ends[:-1])) if ends.size else ends
+
+    record_types = np.full(starts.size, -1, dtype=np.int32)
+    typed = ends - starts >= 2
+    first = starts[typed]
+    record_types[typed] = data[first].astype(np.int32) << 8 | data[first + 1]
+
+    return starts + start, ends + start, record_types
+
+
+def field_column(buf, starts: np.ndarray, ends: np.ndarray, first: int, last: int) -> np.ndarray:
+    """Gather a fixed-width field of many lines into one column.
+
+    Args:
+        buf: File contents
+        starts: Offset of each line
+        ends: Offset just past each line, as returned by scan()
+        first: Start position of the field (1-based index)
+        last: End position of the field (1-based index)
+
+    Returns:
+        np.ndarray: 'S' array with the raw field of each line; bytes past the
+        end of a line read as spaces, like bytes.ljust()
+    """
+    data = np.frombuffer(buf, dtype=np.uint8)
+    width = last - first + 1
+    column = np.full((starts.size, width), 0x20, dtype=np.uint8)
+    positions = np.arange(first - 1, last)
+
+    # Gather in chunks to bound the size of the index arrays
+    for lo in range(0, starts.size, GATHER_CHUNK):
+        hi = lo + GATHER_CHUNK
+        index = starts[lo:hi, None] + positions
+        inside = index < ends[lo:hi, None]
+        column[lo:hi][inside] = data[index[inside]]
+
+    return column.view(f"S{width}").ravel()
+
+
+def parse_num_column(column: np.ndarray) -> np.ndarray:
+    """Convert a column of raw fixed-width numeric fields to int64.
+
+    Vectorized equivalent of data_utils.parse_num: blank fields and fields
+    that are not all digits give 0, and a trailing "-" negates the value.
+
+    Args:
+        column: 'S' array of raw fields, as returned by field_column()
+
+    Returns:
+        np.ndarray: Parsed int64 value of each field
+    """
+    width = column.dtype.itemsize
+    data = np.ascontiguousarray(column).view(np.uint8).reshape(-1, width)
+    positions = np.arange(width)
+
+    # Bounds of the stripped field
+    filled = ~np.isin(data, WHITESPACE)
+    nonblank = filled.any(axis=1)
+    first = filled.argmax(axis=1)
+    last = width - 1 - filled[:, ::-1].argmax(axis=1)
+
+    # For negative numbers the digits end at the last non-blank before the "-"
+    negative = nonblank & (data[np.arange(data.shape[0]), last] == MINUS)
+    before_sign = filled & (positions < last[:, None])
+    last = np.where(negative, width - 1 - before_sign[:, ::-1].argmax(axis=1), last)
+    nonblank &= np.where(negative, before_sign.any(axis=1), True)
+
+    # Accumulate the digits column by column, value * 10 + digit for the
+    # rows whose field covers the column
+    valid = nonblank
+    value = np.zeros(data.shape[0], dtype=np.int64)
+    for pos in range(width):
+        digit = data[:, pos] - np.uint8(ZERO)
+        inside = (first <= pos) & (pos <= last)
+        valid &= ~inside | (digit <= 9)
+        value = np.where(inside, value * 10 + digit, value)
+
+    return np.where(valid, np.where(negative, -value, value), 0)
+
+
+class RecordTable:
+    """Records of a mapped PTSTMT file, or of a byte range of one.
+
+    Record lengths depend on their type, so fields are gathered into
+    columns with field_column() rather than read through strided views.
+
+    Attributes:
+        buf: File contents
+        starts: Offset of each record
+        ends: Offset just past each record, including its trailing newline,
+            as returned by scan()
+        types: record_code() of each record
+    """
+
+    def __init__(self, buf, start: int = 0, stop: int = None):
+        self.buf = buf
+        self.starts, self.ends, self.types = scan(buf, start, stop)
+        self._bounds: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+
+    def bounds(self, record_type: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Get the start and end offsets of the records of one type.
+
+        Args:
+            record_type: record_code() of the record type
+
+        Returns:
+            Tuple of (starts, ends) arrays, in file order
+        """
+        if record_type not in self._bounds:
+            rows = self.types == record_type
+            self._bounds[record_type] = (self.starts[rows], self.ends[rows])
+        return self._bounds[record_type]
+
+    def column(self, record_type: int, first: int, last: int) -> np.ndarray:
+        """Gather a field of every record of one type.
+
+        Args:
+            record_type: record_code() of the record type
+            first: Field start position (1-based)
+            last: Field end position (1-based, inclusive)
+
+        Returns:
+            np.ndarray: 'S' array of the field, as returned by field_column()
+        """
+        return field_column(self.buf, *self.bounds(record_type), first, last)
+
+
+@contextlib.contextmanager
+def load_ptstmt(file_path: str, start: int = 0, stop: int = None) -> Iterator[RecordTable]:
+    """Map a PTSTMT file and locate its records.
+
+    Args:
+        file_path: Path to PTSTMT file
+        start: Offset of the first record to include
+        stop: Offset just past the last record to include (end of file if None)
+
+    Yields:
+        RecordTable: Records of the range, valid until the context exits
+    """
+    with open(file_path, "rb") as f, map_file(f) as buf:
+        yield RecordTable(buf, start, stop)
+
+
+def block_sums(block_ids: np.ndarray, values: np.ndarray, n_blocks: int) -> np.ndarray:
+    """Sum values per header block.
+
+    Args:
+        block_ids: Block id of each value, -1 for values before the first block
+        values: int64 values to sum
+        n_blocks: Number of header blocks
+
+    Returns:
+        np.ndarray: int64 sums; index 0 holds block -1, index b + 1 block b
+    """
+    sums = np.zeros(n_blocks + 1, dtype=np.int64)
+    np.add.at(sums, block_ids + 1, values)
+    return sums
+
+
+def line_at(buf, start: int) -> bytes:
+    """Return the line of buf beginning at offset start, including its newline.
+
+    Args:
+        buf: File contents
+        start: Offset of the first byte of the line
+
+    Returns:
+        bytes: Raw line
+    """
+    end = buf.find(b"\n", start)
+    return buf[start:] if end == -1 else buf[start:end + 1]
+
+
+def block_cr_totals(trx_blocks, trx_amounts, trx_is_cr, n_blocks: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Aggregate CR transactions per header block.
+
+    Args:
+        trx_blocks: Header block id of each transaction (int64 buffer)
+        trx_amounts: Amount of each transaction (int64 buffer)
+        trx_is_cr: 1 for CR transactions, 0 otherwise (uint8 buffer)
+        n_blocks: Number of header blocks
+
+    Returns:
+        Tuple of (has_cr, cr_total) arrays indexed by block id
+    """
+    blocks = np.frombuffer(trx_blocks, dtype=np.int64)
+    amounts = np.frombuffer(trx_amounts, dtype=np.int64)
+    cr = np.frombuffer(trx_is_cr, dtype=np.uint8).astype(bool)
+
+    cr_blocks = blocks[cr]
+    has_cr = np.bincount(cr_blocks, minlength=n_blocks) > 0
+    # np.add.at keeps the sums exact in int64 (bincount weights are float64)
+    cr_total = np.zeros(n_blocks, dtype=np.int64)
+    np.add.at(cr_total, cr_blocks, amounts[cr])
+
+    return has_cr, cr_total
+
+
+def rebase(ids, base: int, skip: int = 0) -> bytes:
+    """Offset a buffer of int64 ids, e.g. shard-local block ids.
+
+    Args:
+        ids: Ids to offset (int64 buffer)
+        base: Value added to every id
+        skip: Number of leading ids to drop
+
+    Returns:
+        bytes: Offset ids as raw int64 values
+    """
+    return (np.frombuffer(ids, dtype=np.int64)[skip:] + base).tobytes()
+
+
+def duplicate_lines(trx_keys, trx_offsets) -> Tuple[np.ndarray, np.ndarray]:
+    """Find transaction keys that occur more than once.
+
+    Args:
+        trx_keys: Duplicate-detection key of each transaction (uint64 buffer)
+        trx_offsets: Line offset of each transaction (int64 buffer)
+
+    Returns:
+        Tuple of (offsets, counts) for each duplicated key, in order of first
+        occurrence: offsets holds the offset of the key's first line
+    """
+    keys = np.frombuffer(trx_keys, dtype=np.uint64)
+    offsets = np.frombuffer(trx_offsets, dtype=np.int64)
+
+    _, first, counts = np.unique(keys, return_index=True, return_counts=True)
+    repeated = counts > 1
+    first, counts = first[repeated], counts[repeated]
+    order = np.argsort(first)
+
+    return offsets[first[order]], counts[order]
@@ -4,20 +4,219 @@ Contains the main validation logic for PTSTMT files.
 """
 
 import datetime
-import re
+import os
+import sys
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
-from typing import List, Dict, Tuple, Callable
+from typing import List, Dict, Tuple, Callable, Iterator, Optional, Union
 
+import numpy as np
+
+from src.core._scan import (
+    load_ptstmt, shard_bounds, map_file, parse_num_column, line_at, block_sums,
+    block_cr_totals, duplicate_lines, rebase, record_code, REC_01, REC_02, REC_03, REC_04
+)
 from src.utils.data_utils import (
-    extract_posting_date, 
-    extract_card_number, 
     to_date, 
-    slice_num, 
-    slice_str, 
-    custom_round
+    normalize_card,
+    decode_field,
+    parse_num, 
+    parse_transaction,
+    transaction_key,
+    custom_round_array,
+    CUSTOMER_RECORD,
+    TRANSACTION_RECORD,
+    FIELD_SPANS
 )
 
 
+# Minimum file size per worker process for parallel validation
+SHARD_BYTES = 16 * 1024 * 1024
+
+# Worker processes allowed by ProcessPoolExecutor on Windows
+# (WaitForMultipleObjects limit)
+MAX_WINDOWS_WORKERS = 61
+
+# Target size of the byte ranges a file is validated in; each range's rows
+# are ready as soon as it is done
+RANGE_BYTES = 4 * 1024 * 1024
+
+# Numeric fields of the header record, in the order validate_range()
+# unpacks each header's values
+HEADER_NUMBERS = ('amount_due', 'cr_limit', 'avl_actual', 'prev', 'tot_payment', 'int', 'new_bal', 'instl')
+
+# States of the record sequence automaton for ^01(02(03)*04)((02|03)(03)*04)*$
+SEQ_START, SEQ_OPEN, SEQ_BLOCK, SEQ_CLOSED, SEQ_DEAD = range(5)
+
+# Next state after each record type, indexed by the current state:
+#        START     OPEN       BLOCK       CLOSED     DEAD
+SEQ_NEXT = {
+    "01": (SEQ_OPEN, SEQ_DEAD, SEQ_DEAD, SEQ_DEAD, SEQ_DEAD),
+    "02": (SEQ_DEAD, SEQ_BLOCK, SEQ_DEAD, SEQ_BLOCK, SEQ_DEAD),
+    "03": (SEQ_DEAD, SEQ_DEAD, SEQ_BLOCK, SEQ_BLOCK, SEQ_DEAD),
+    "04": (SEQ_DEAD, SEQ_DEAD, SEQ_CLOSED, SEQ_DEAD, SEQ_DEAD),
+}
+
+
+def filtered_entry(buf, start: int, date_cache: Dict[bytes, Union[datetime.date, str]]) -> Dict:
+    """Build a filtered transaction row from the line at offset start.
+
+    Args:
+        buf: File contents
+        start: Offset of the line
+        date_cache: Posting date (or its str form) of each raw posting date field
+
+    Returns:
+        Dict: Filtered transaction row
+    """
+    raw = line_at(buf, start)
+    card, posting = TRANSACTION_RECORD.unpack_from(raw.ljust(TRANSACTION_RECORD.size))[:2]
+    return {
+        "posting": date_cache[posting],
+        "card": normalize_card(card),
+        "line": raw.decode("latin-1").rstrip()
+    }
+
+
+def zero_amount_entry(buf, start: int, date_cache: Dict[bytes, Union[datetime.date, str]]) -> Dict:
+    """Build a zero amount transaction row from the line at offset start.
+
+    Args:
+        buf: File contents
+        start: Offset of the line
+        date_cache: Posting date (or its str form) of each raw posting date field
+
+    Returns:
+        Dict: Zero amount transaction row
+    """
+    card, posting, detail, amount, direction = \
+        TRANSACTION_RECORD.unpack_from(line_at(buf, start).ljust(TRANSACTION_RECORD.size))
+    return {
+        "card": normalize_card(card),
+        "posting_date": date_cache[posting],
+        "trx_detail": decode_field(detail),
+        "amount": parse_num(amount),
+        "direction": decode_field(direction)
+    }
+
+
+def extend_sequence(seq: List[list], record_type: str):
+    """Append a record type to a run-length encoded sequence.
+
+    Args:
+        seq: List of [record_type, count] runs
+        record_type: Record type to append
+    """
+    if seq and seq[-1][0] == record_type:
+        seq[-1][1] += 1
+    else:
+        seq.append([record_type, 1])
+
+
+def format_sequence(seq: List[list]) -> str:
+    """Render a run-length encoded sequence for display, e.g. "01->02->03x12->04".
+
+    Args:
+        seq: List of [record_type, count] runs
+
+    Returns:
+        str: Display string, with runs longer than one shown as "<type>x<count>"
+    """
+    return "->".join(rt if count == 1 else f"{rt}x{count}" for rt, count in seq)
+
+
+def validate_block(header: Dict, dr_total: int, cr_total: int,
+                   validations: List[Dict], card_type: str):
+    """Validate a completed card block.
+
+    Args:
+        header: Header data dictionary
+        dr_total: Sum of DR transaction amounts in the block
+        cr_total: Sum of CR transaction amounts in the block
+        validations: List to append validation results to
+        card_type: Type of card
+    """
+    # custom_round() inlined: the balances are sums of parsed ints (well within
+    # float precision), so only the minimum payment needs rounding
+    expected_new = dr_total + header['prev'] + header['int'] - cr_total
+
+    expected_avl = header['cr_limit'] - expected_new - header['instl']
+
+    if card_type == "CORPORATE":
+        expected_min_pay = expected_new
+    else:
+        min_pay = expected_new * 0.05
+        expected_min_pay = int(min_pay)
+        if min_pay - expected_min_pay >= 0.5:
+            expected_min_pay += 1
+        if expected_min_pay < 50000:
+            expected_min_pay = 50000
+
+    if expected_new <= 0:
+        expected_min_pay = 0
+
+    append_checks(validations, header, expected_new, expected_avl, expected_min_pay)
+
+
+def validate_blocks(headers: List[Dict], dr_totals: List[int], cr_totals: List[int],
+                    validations: List[Dict], card_type: str):
+    """Validate completed card blocks in one vectorized pass.
+
+    Same checks as validate_block, computed for all blocks at once.
+
+    Args:
+        headers: Header data dictionary of each block
+        dr_totals: Sum of DR transaction amounts in each block
+        cr_totals: Sum of CR transaction amounts in each block
+        validations: List to append validation results to
+        card_type: Type of card
+    """
+    def column(key: str) -> np.ndarray:
+        return np.array([header[key] for header in headers], dtype=np.int64)
+
+    expected_new = (np.array(dr_totals, dtype=np.int64) + column('prev') + column('int')
+                    - np.array(cr_totals, dtype=np.int64))
+
+    expected_avl = column('cr_limit') - expected_new - column('instl')
+
+    if card_type == "CORPORATE":
+        expected_min_pay = expected_new
+    else:
+        expected_min_pay = np.maximum(custom_round_array(expected_new * 0.05), 50000)
+
+    expected_min_pay = np.where(expected_new <= 0, 0, expected_min_pay)
+
+    for header, new, avl, min_pay in zip(headers, expected_new.tolist(), expected_avl.tolist(),
+                                         expected_min_pay.tolist()):
+        append_checks(validations, header, new, avl, min_pay)
+
+
+def append_checks(validations: List[Dict], header: Dict, expected_new: int,
+                  expected_avl: int, expected_min_pay: int):
+    """Append the validation results of a block.
+
+    Args:
+        validations: List to append validation results to
+        header: Header data dictionary
+        expected_new: Expected NEW_BAL
+        expected_avl: Expected AVL_CR_LIMIT
+        expected_min_pay: Expected PT_SH_MIN_PAYMENT
+    """
+    card = header['card']
+
+    def check(field: str, exp, act) -> Dict:
+        return {
+            "card": card, "field": field, "expected": exp,
+            "actual": act, "status": "PASS" if exp == act else "FAIL"
+        }
+
+    validations.append(check("NEW_BAL", expected_new, header['new_bal']))
+    validations.append(check("AVL_CR_LIMIT", expected_avl, header['avl_actual']))
+    validations.append(check("PT_SH_MIN_PAYMENT", expected_min_pay, header['amount_due']))
+
+
 @dataclass
 class ValidationResult:
     """Data class to hold validation results."""
@@ -30,12 +229,419 @@ class ValidationResult:
     sequence_results: List[Dict]
 
 
+@dataclass
+class PartialResult:
+    """Data class to hold the collected data of one byte range of a file.
+
+    Block ids are local to the range. Transactions before the range's first
+    header belong to the block left open by the previous range: they come
+    first in the trx_* buffers and carry block id -1.
+    """
+    filtered_transactions: List[Dict]
+    validations: List[Dict]  # Blocks closed inside the range
+    zero_amount_transactions: List[Dict]
+    card_records: Dict[str, set]
+    customer_sequences: Dict[str, List[list]]
+    customer_states: Dict[str, int]
+    card_blocks: Dict[str, int]
+    block_tot_payment: array
+    trx_keys: array
+    trx_offsets: array
+    trx_blocks: array
+    trx_amounts: array
+    trx_is_cr: bytearray
+    lead_transactions: int  # Transactions before the first header
+    lead_totals: Tuple[int, int]  # (DR, CR) totals before the first header
+    tail: Optional[Tuple[Dict, int, int]]  # (header, DR, CR) of the open block
+
+
+def validate_range(file_path: str, range_start: int, range_stop: int, card_type: str, target_header_type: int,
+                   from_date: datetime.date, until_date: datetime.date,
+                   progress_callback: Callable[[int, int], None] = None,
+                   format_dates: bool = False) -> PartialResult:
+    """Collect validation data for the records in a byte range of a PTSTMT file.
+
+    Module-level so it can run in a worker process.
+
+    Args:
+        file_path: Path to PTSTMT file
+        range_start: Offset of the first record (start of file or of a 01 record)
+        range_stop: Offset just past the last record
+        card_type: Type of card ('REGULAR' or 'CORPORATE')
+        target_header_type: record_code() of the header record type
+        from_date: Start date for filtering
+        until_date: End date for filtering
+        progress_callback: Optional callback receiving (bytes_processed, range_stop)
+        format_dates: Whether filtered and zero amount rows carry posting
+            dates as str, formatted once per distinct date, instead of date objects
+
+    Returns:
+        PartialResult: Data collected for the range
+    """
+    # Data collectors
+    validations = []
+    headers = []  # header data of each block, in order
+    card_records = {}  # customer -> set of record types
+    trx_keys = array("Q")  # For duplicate detection: key of each transaction
+    card_blocks = {}  # card -> id of its latest header block
+    block_tot_payment = array("q")  # block id -> tot_payment from prefix 02
+    customer_sequences = {}  # customer -> run-length encoded record types
+    customer_states = {}  # customer -> sequence automaton state
+
+    # State
+    current_customer = None
+    current_types = None  # card_records entry of current_customer
+    current_sequence = None  # customer_sequences entry of current_customer
+
+    # Bind names used on every record to locals
+    _unpack_customer = CUSTOMER_RECORD.unpack_from
+    _customer_size = CUSTOMER_RECORD.size
+    _unpack_transaction = TRANSACTION_RECORD.unpack_from
+    _transaction_size = TRANSACTION_RECORD.size
+    _transaction_key = transaction_key
+    _normalize_card = normalize_card
+    _decode_field = decode_field
+    _append_key = trx_keys.append
+    _extend_sequence = extend_sequence
+    _next_03 = SEQ_NEXT["03"]
+
+    with load_ptstmt(file_path, range_start, range_stop) as table:
+        buf = table.buf
+        starts, ends, record_types = table.starts, table.ends, table.types
+
+        is_trx = record_types == REC_03
+        trx_starts = table.bounds(REC_03)[0]
+        # Header block of each transaction; -1 before the range's first header
+        trx_block = np.cumsum(record_types == target_header_type, dtype=np.int64)[is_trx] - 1
+
+        # Header fields are parsed column-wise and taken in order by the loop
+        header_rows = zip(
+            table.column(target_header_type, *FIELD_SPANS['card']).tolist(),
+            *(parse_num_column(table.column(target_header_type, *FIELD_SPANS[name])).tolist()
+              for name in HEADER_NUMBERS)
+        )
+
+        # Posting dates are parsed and checked once per distinct value;
+        # statements share few dates. The 8-byte fields are deduplicated as
+        # uint64 words, which sorts much faster than the bytes themselves
+        posting_column = table.column(REC_03, *FIELD_SPANS['posting_date'])
+        postings, posting_index = np.unique(posting_column.view(np.uint64), return_inverse=True)
+        date_cache = {raw: to_date(raw) for raw in postings.view(posting_column.dtype).tolist()}
+        outside = np.array([d < from_date or d > until_date for d in date_cache.values()], dtype=bool)
+        # Duplicates are keyed by the parsed date, which differently padded
+        # fields can share
+        ordinal_cache = {raw: d.toordinal() for raw, d in date_cache.items()}
+        filtered_offsets = trx_starts[outside[posting_index]]
+
+        trx_amount = parse_num_column(table.column(REC_03, *FIELD_SPANS['trx_amt']))
+        trx_direction = table.column(REC_03, *FIELD_SPANS['trx_dir'])
+        is_dr = trx_direction == b"DR"
+        is_cr = trx_direction == b"CR"
+        zero_amount_offsets = trx_starts[trx_amount == 0]
+        amounts = iter(trx_amount.tolist())  # taken in order by the 03 records
+
+        # Records are unpacked straight from the mapped file; only lines
+        # shorter than their layout are copied (and padded)
+        records = zip(starts.tolist(), ends.tolist(), record_types.tolist())
+
+        for line_no, (start, end, record_type) in enumerate(records, 1):
+            if progress_callback and line_no % 1000 == 0:
+                progress_callback(end, range_stop)
+
+            # Track structure validation
+            if record_type == REC_01:
+                if end - start >= _customer_size:
+                    customer, = _unpack_customer(buf, start)
+                else:
+                    customer, = _unpack_customer(buf[start:end].ljust(_customer_size))
+                current_customer = customer.decode("latin-1").strip()
+                if current_customer not in card_records:
+                    card_records[current_customer] = set()
+                    customer_sequences[current_customer] = []
+                    customer_states[current_customer] = SEQ_START
+                current_types = card_records[current_customer]
+                current_sequence = customer_sequences[current_customer]
+                current_types.add("01")
+                _extend_sequence(current_sequence, "01")
+                customer_states[current_customer] = SEQ_NEXT["01"][customer_states[current_customer]]
+
+            if record_type == target_header_type:
+                (card, amount_due, cr_limit, avl_actual, prev, tot_payment,
+                 interest, new_bal, instl) = next(header_rows)
+                current_card = _normalize_card(card)
+                headers.append({
+                    'card': current_card,
+                    'prev': prev,
+                    'int': interest,
+                    'cr_limit': cr_limit,
+                    'instl': instl,
+                    'new_bal': new_bal,
+                    'amount_due': amount_due,
+                    'avl_actual': avl_actual
+                })
+
+                card_blocks[current_card] = len(block_tot_payment)
+                block_tot_payment.append(tot_payment)
+
+                if record_type == REC_02 and current_customer:
+                    current_types.add("02")
+                    _extend_sequence(current_sequence, "02")
+                    customer_states[current_customer] = SEQ_NEXT["02"][customer_states[current_customer]]
+
+            elif record_type == REC_03:
+                # Track for duplicate detection
+                if end - start >= _transaction_size:
+                    trx_fields = _unpack_transaction(buf, start)
+                else:
+                    trx_fields = _unpack_transaction(buf[start:end].ljust(_transaction_size))
+                card, posting, detail, _, direction = trx_fields
+                _append_key(_transaction_key(_normalize_card(card), ordinal_cache[posting],
+                                             _decode_field(detail), next(amounts),
+                                             _decode_field(direction)))
+
+                if current_customer:
+                    current_types.add("03")
+                    _extend_sequence(current_sequence, "03")
+                    customer_states[current_customer] = _next_03[customer_states[current_customer]]
+
+            elif record_type == REC_04:
+                if current_customer:
+                    current_types.add("04")
+                    _extend_sequence(current_sequence, "04")
+                    customer_states[current_customer] = SEQ_NEXT["04"][customer_states[current_customer]]
+
+        # Filtered and zero amount lines are re-read from the mapped file,
+        # so build their rows before it is closed
+        row_dates = {raw: str(d) for raw, d in date_cache.items()} if format_dates else date_cache
+        filtered = [filtered_entry(buf, start, row_dates) for start in filtered_offsets.tolist()]
+        zero_amount_transactions = [
+            zero_amount_entry(buf, start, row_dates) for start in zero_amount_offsets.tolist()
+        ]
+
+    # Validate the blocks closed inside the range; totals at index 0 come
+    # before the first header and are handed to the previous range
+    dr_totals = block_sums(trx_block[is_dr], trx_amount[is_dr], len(headers)).tolist()
+    cr_totals = block_sums(trx_block[is_cr], trx_amount[is_cr], len(headers)).tolist()
+    validate_blocks(headers[:-1], dr_totals[1:-1], cr_totals[1:-1], validations, card_type)
+    lead_totals = (dr_totals[0], cr_totals[0])
+    tail = (headers[-1], dr_totals[-1], cr_totals[-1]) if headers else None
+
+    # Only transactions of blocks with a card are tracked for tot_payment
+    # validation; lead transactions are resolved by the merger
+    has_card = np.array([True] + [bool(header['card']) for header in headers])
+    tracked = has_card[trx_block + 1]
+
+    return PartialResult(
+        filtered_transactions=filtered,
+        validations=validations,
+        zero_amount_transactions=zero_amount_transactions,
+        card_records=card_records,
+        customer_sequences=customer_sequences,
+        customer_states=customer_states,
+        card_blocks=card_blocks,
+        block_tot_payment=block_tot_payment,
+        trx_keys=trx_keys,
+        trx_offsets=array("q", trx_starts.astype(np.int64).tobytes()),
+        trx_blocks=array("q", trx_block[tracked].astype(np.int64).tobytes()),
+        trx_amounts=array("q", trx_amount[tracked].astype(np.int64).tobytes()),
+        trx_is_cr=bytearray(is_cr[tracked].tobytes()),
+        lead_transactions=int(np.count_nonzero(trx_block < 0)),
+        lead_totals=lead_totals,
+        tail=tail
+    )
+
+
+def process_ranges(file_path: str, card_type: str, target_header_type: int,
+                   from_date: datetime.date, until_date: datetime.date,
+                   progress_callback: Callable[[int, int], None] = None,
+                   format_dates: bool = False) -> Iterator[PartialResult]:
+    """Validate a PTSTMT file as byte ranges split at 01 records.
+
+    The file is split into ranges of about RANGE_BYTES, yielded one at a
+    time so each one's rows can be used while the rest of the file is
+    scanned. Files of at least two SHARD_BYTES are validated in a process
+    pool, one range per task; smaller files are validated in-process.
+
+    Args:
+        file_path: Path to PTSTMT file
+        card_type: Type of card ('REGULAR' or 'CORPORATE')
+        target_header_type: record_code() of the header record type
+        from_date: Start date for filtering
+        until_date: End date for filtering
+        progress_callback: Optional callback receiving (bytes_processed, total_bytes)
+        format_dates: Passed to validate_range
+
+    Yields:
+        PartialResult of each range, in file order
+    """
+    total_bytes = os.path.getsize(file_path)
+    workers = min(os.cpu_count() or 1, total_bytes // SHARD_BYTES)
+    if sys.platform == "win32":
+        workers = min(workers, MAX_WINDOWS_WORKERS)
+
+    with open(file_path, "rb") as f, map_file(f) as buf:
+        ranges = shard_bounds(buf, max(1, -(-total_bytes // RANGE_BYTES)))
+
+    if workers < 2:
+        def range_progress(processed: int, _range_stop: int):
+            progress_callback(processed, total_bytes)
+
+        for start, stop in ranges:
+            part = validate_range(file_path, start, stop, card_type, target_header_type,
+                                  from_date, until_date, progress_callback and range_progress,
+                                  format_dates)
+            if progress_callback:
+                progress_callback(stop, total_bytes)
+            yield part
+        return
+
+    # Only a few ranges per worker are in flight, so finished results never
+    # pile up ahead of the consumer
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+
+        def next_part() -> PartialResult:
+            future, stop = pending.popleft()
+            part = future.result()
+            if progress_callback:
+                progress_callback(stop, total_bytes)
+            return part
+
+        for start, stop in ranges:
+            if len(pending) == workers * 2:
+                yield next_part()
+            pending.append((pool.submit(validate_range, file_path, start, stop, card_type,
+                                        target_header_type, from_date, until_date, None,
+                                        format_dates), stop))
+        while pending:
+            yield next_part()
+
+
+class ResultMerger:
+    """Combines the PartialResults of consecutive byte ranges, in file order."""
+
+    def __init__(self, card_type: str, keep_rows: bool = True):
+        """Initialize merger.
+
+        Args:
+            card_type: Type of card ('REGULAR' or 'CORPORATE')
+            keep_rows: Whether to keep the validation, filtered and zero amount
+                rows; callers that only stream them pass False
+        """
+        self.card_type = card_type
+        self.keep_rows = keep_rows
+        self.filtered_transactions = []
+        self.validations = []
+        self.zero_amount_transactions = []
+        self.card_records = {}
+        self.customer_sequences = {}
+        self.customer_states = {}
+        self.card_blocks = {}
+        self.block_tot_payment = array("q")
+        self.trx_keys = array("Q")
+        self.trx_offsets = array("q")
+        self.trx_blocks = array("q")
+        self.trx_amounts = array("q")
+        self.trx_is_cr = bytearray()
+        self._open_block = None  # [header, dr_total, cr_total] of the last block
+        self._last_card = None  # card of the last header block
+
+    def add(self, part: PartialResult) -> List[Dict]:
+        """Merge the result of the next range.
+
+        Args:
+            part: PartialResult of the range following the previously added one
+
+        Returns:
+            List of validation results for the blocks closed by this range
+        """
+        validations = []
+
+        # Lead transactions continue the block left open by the previous range
+        if self._open_block is not None:
+            self._open_block[1] += part.lead_totals[0]
+            self._open_block[2] += part.lead_totals[1]
+            if part.tail is not None:
+                validate_block(*self._open_block, validations, self.card_type)
+        if part.tail is not None:
+            self._open_block = list(part.tail)
+        validations.extend(part.validations)
+
+        if self.keep_rows:
+            self.validations.extend(validations)
+            self.filtered_transactions.extend(part.filtered_transactions)
+            self.zero_amount_transactions.extend(part.zero_amount_transactions)
+
+        for customer, types in part.card_records.items():
+            if customer in self.card_records:
+                self.card_records[customer] |= types
+            else:
+                self.card_records[customer] = types
+        self._merge_sequences(part.customer_sequences, part.customer_states)
+
+        base = len(self.block_tot_payment)
+        skip = 0 if self._last_card else part.lead_transactions
+        for card, block in part.card_blocks.items():
+            self.card_blocks[card] = base + block
+        self.block_tot_payment.extend(part.block_tot_payment)
+        if part.tail is not None:
+            self._last_card = part.tail[0]['card']
+
+        self.trx_keys.extend(part.trx_keys)
+        self.trx_offsets.extend(part.trx_offsets)
+        self.trx_blocks.frombytes(rebase(part.trx_blocks, base, skip))
+        self.trx_amounts.extend(part.trx_amounts[skip:])
+        self.trx_is_cr += part.trx_is_cr[skip:]
+
+        return validations
+
+    def finish(self) -> List[Dict]:
+        """Validate the block left open by the last range.
+
+        Returns:
+            List of validation results for that block
+        """
+        validations = []
+        if self._open_block is not None:
+            validate_block(*self._open_block, validations, self.card_type)
+            self._open_block = None
+        if self.keep_rows:
+            self.validations.extend(validations)
+        return validations
+
+    def _merge_sequences(self, customer_sequences: Dict[str, List[list]],
+                         customer_states: Dict[str, int]):
+        """Append a range's record sequences to those of the same customers.
+
+        Args:
+            customer_sequences: Dictionary mapping customers to their [record_type, count] runs
+            customer_states: Dictionary mapping customers to their automaton state
+        """
+        for customer, seq in customer_sequences.items():
+            merged = self.customer_sequences.get(customer)
+            if merged is None:
+                self.customer_sequences[customer] = seq
+                self.customer_states[customer] = customer_states[customer]
+                continue
+
+            state = self.customer_states[customer]
+            for record_type, count in seq:
+                if merged[-1][0] == record_type:
+                    merged[-1][1] += count
+                else:
+                    merged.append([record_type, count])
+                # Every SEQ_NEXT transition is idempotent after two steps
+                for _ in range(min(count, 2)):
+                    state = SEQ_NEXT[record_type][state]
+            self.customer_states[customer] = state
+
+
 class PTSTMTValidator:
     """Main validator class for PTSTMT files."""
-    
+
     def __init__(self, file_path: str, card_type: str, from_date: datetime.date, until_date: datetime.date):
         """Initialize validator.
-        
+
         Args:
             file_path: Path to PTSTMT file
             card_type: Type of card ('REGULAR' or 'CORPORATE')
@@ -47,185 +653,45 @@ class PTSTMTValidator:
         self.from_date = from_date
         self.until_date = until_date
         self.target_header_type = "02" if card_type == "REGULAR" else "01"
-    
+
     def process_file(self, progress_callback: Callable[[int, int], None] = None) -> ValidationResult:
         """Process the PTSTMT file and return validation results.
-        
+
         Args:
-            progress_callback: Optional callback for progress updates
-            
+            progress_callback: Optional callback receiving (bytes_processed, total_bytes)
+
         Returns:
             ValidationResult: Object containing all validation results
         """
-        # Count total lines
-        with open(self.file_path, "r", encoding="latin-1") as f:
-            total_lines = sum(1 for _ in f)
-        
-        # Data collectors
-        filtered = []
-        validations = []
-        card_records = {}  # customer -> set of record types
-        transaction_tracker = {}  # For duplicate detection: key -> count
-        card_transactions = {}  # card -> list of transactions for CR check
-        card_tot_payment = {}  # card -> tot_payment from prefix 02
-        zero_amount_transactions = []  # Transactions with amount = 0
-        customer_sequences = {}  # customer -> list of record types
-        
-        # State
-        current_header = None
-        current_stats = {"DR": 0, "CR": 0}
-        current_customer = None
-        current_card = None
-        processed = 0
-        
-        # Process file
-        with open(self.file_path, "r", encoding="latin-1") as f:
-            for line in f:
-                processed += 1
-                
-                if progress_callback and processed % 1000 == 0:
-                    progress_callback(processed, total_lines)
-                
-                record_type = line[:2]
-                
-                # Track structure validation
-                if record_type == "01":
-                    current_customer = slice_str(line, 3, 18)
-                    if current_customer not in card_records:
-                        card_records[current_customer] = set()
-                        customer_sequences[current_customer] = []
-                    card_records[current_customer].add("01")
-                    customer_sequences[current_customer].append("01")
-                
-                if record_type == self.target_header_type:
-                    if current_header is not None:
-                        self._validate_block(current_header, current_stats, validations, self.card_type)
-                    
-                    current_stats = {"DR": 0, "CR": 0}
-                    current_card = slice_str(line, 28, 43)
-                    current_header = {
-                        'card': current_card,
-                        'prev': slice_num(line, 324, 338),
-                        'int': slice_num(line, 399, 413),
-                        'cr_limit': slice_num(line, 279, 292),
-                        'instl': slice_num(line, 891, 900),
-                        'new_bal': slice_num(line, 414, 428),
-                        'amount_due': slice_num(line, 264, 277),
-                        'avl_actual': slice_num(line, 294, 308)
-                    }
-                    
-                    tot_payment = slice_num(line, 354, 367)
-                    card_tot_payment[current_card] = tot_payment
-                    card_transactions[current_card] = []
-                    
-                    if record_type == "02" and current_customer:
-                        card_records[current_customer].add("02")
-                        customer_sequences[current_customer].append("02")
-                
-                elif record_type == "03":
-                    posting_date = to_date(extract_posting_date(line))
-                    card_num = extract_card_number(line)
-                    trx_detail = slice_str(line, 90, 129)
-                    trx_amt = slice_num(line, 149, 162)
-                    trx_dir = slice_str(line, 163, 164)
-                    
-                    if posting_date < self.from_date or posting_date > self.until_date:
-                        filtered.append({
-                            "posting": posting_date,
-                            "card": card_num,
-                            "line": line.rstrip()
-                        })
-                    
-                    # Track for duplicate detection
-                    dup_key = (card_num, posting_date, trx_detail, trx_amt, trx_dir)
-                    transaction_tracker[dup_key] = transaction_tracker.get(dup_key, 0) + 1
-                    
-                    # Track CR transactions for tot_payment validation
-                    if current_card and current_card in card_transactions:
-                        card_transactions[current_card].append({
-                            'direction': trx_dir,
-                            'amount': trx_amt
-                        })
-                    
-                    # Track zero amount transactions
-                    if trx_amt == 0:
-                        zero_amount_transactions.append({
-                            "card": card_num,
-                            "posting_date": posting_date,
-                            "trx_detail": trx_detail,
-                            "amount": trx_amt,
-                            "direction": trx_dir
-                        })
-                    
-                    if current_header is not None:
-                        current_stats[trx_dir] = current_stats.get(trx_dir, 0) + trx_amt
-                    
-                    if current_customer:
-                        card_records[current_customer].add("03")
-                        customer_sequences[current_customer].append("03")
-                
-                elif record_type == "04":
-                    if current_customer:
-                        card_records[current_customer].add("04")
-                        customer_sequences[current_customer].append("04")
-        
-        # Validate last block
-        if current_header is not None:
-            self._validate_block(current_header, current_stats, validations, self.card_type)
-        
+        merger = ResultMerger(self.card_type)
+        for part in process_ranges(self.file_path, self.card_type, record_code(self.target_header_type),
+                                   self.from_date, self.until_date, progress_callback):
+            merger.add(part)
+        merger.finish()
+
+        # Duplicate lines are re-read from the mapped file
+        with open(self.file_path, "rb") as f, map_file(f) as buf:
+            duplicate_results = self._generate_duplicate_results(
+                merger.trx_keys, merger.trx_offsets, buf)
+
         # Generate results
-        structure_results = self._generate_structure_results(card_records)
-        duplicate_results = self._generate_duplicate_results(transaction_tracker)
-        totpay_results = self._generate_totpay_results(card_tot_payment, card_transactions)
-        sequence_results = self._generate_sequence_results(customer_sequences)
-        
+        structure_results = self._generate_structure_results(merger.card_records)
+        totpay_results = self._generate_totpay_results(
+            merger.card_blocks, merger.block_tot_payment,
+            merger.trx_blocks, merger.trx_amounts, merger.trx_is_cr)
+        sequence_results = self._generate_sequence_results(
+            merger.customer_sequences, merger.customer_states)
+
         return ValidationResult(
-            filtered_transactions=filtered,
-            validations=validations,
+            filtered_transactions=merger.filtered_transactions,
+            validations=merger.validations,
             structure_results=structure_results,
             duplicate_transactions=duplicate_results,
-            zero_amount_transactions=zero_amount_transactions,
+            zero_amount_transactions=merger.zero_amount_transactions,
             tot_payment_results=totpay_results,
             sequence_results=sequence_results
         )
-    
-    def _validate_block(self, header: Dict, stats: Dict, validations: List[Dict], card_type: str):
-        """Validate a completed card block.
-        
-        Args:
-            header: Header data dictionary
-            stats: Transaction statistics
-            validations: List to append validation results to
-            card_type: Type of card
-        """
-        card = header['card']
-        
-        expected_new = stats["DR"] + header['prev'] + header['int'] - stats["CR"]
-        expected_new = custom_round(expected_new)
-        
-        expected_avl = header['cr_limit'] - expected_new - header['instl']
-        expected_avl = custom_round(expected_avl)
-        
-        if card_type == "CORPORATE":
-            expected_min_pay = expected_new
-        else:
-            expected_min_pay = custom_round(expected_new * 0.05)
-            if expected_min_pay < 50000:
-                expected_min_pay = 50000
-        
-        if expected_new <= 0:
-            expected_min_pay = 0
-        
-        def check(field: str, exp, act) -> Dict:
-            return {
-                "card": card, "field": field, "expected": exp,
-                "actual": act, "status": "PASS" if exp == act else "FAIL"
-            }
-        
-        validations.append(check("NEW_BAL", expected_new, header['new_bal']))
-        validations.append(check("AVL_CR_LIMIT", expected_avl, header['avl_actual']))
-        validations.append(check("PT_SH_MIN_PAYMENT", expected_min_pay, header['amount_due']))
-    
+
     def _generate_structure_results(self, card_records: Dict[str, set]) -> List[Dict]:
         """Generate structure validation results.
         
@@ -252,52 +718,64 @@ class PTSTMTValidator:
         
         return results
     
-    def _generate_duplicate_results(self, transaction_tracker: Dict[Tuple, int]) -> List[Dict]:
+    def _generate_duplicate_results(self, trx_keys: array, trx_offsets: array,
+                                    buf: bytes) -> List[Dict]:
         """Generate duplicate transaction results.
-        
+
         Args:
-            transaction_tracker: Dictionary tracking transaction counts
-            
+            trx_keys: Duplicate-detection key of each transaction
+            trx_offsets: Line offset of each transaction
+            buf: File contents (mapped)
+
         Returns:
-            List of duplicate transaction result dictionaries
+            List of duplicate transaction result dictionaries, in order of first occurrence
         """
         results = []
-        
-        for key, count in transaction_tracker.items():
-            if count > 1:  # Only include duplicates
-                card, posting_date, trx_detail, amount, direction = key
-                results.append({
-                    "card": card,
-                    "posting_date": posting_date,
-                    "trx_detail": trx_detail,
-                    "amount": amount,
-                    "direction": direction,
-                    "count": count
-                })
+
+        dup_offsets, dup_counts = duplicate_lines(trx_keys, trx_offsets)
+        for offset, count in zip(dup_offsets.tolist(), dup_counts.tolist()):
+            card, posting_date, trx_detail, amount, direction = \
+                parse_transaction(line_at(buf, offset))
+            results.append({
+                "card": card,
+                "posting_date": posting_date,
+                "trx_detail": trx_detail,
+                "amount": amount,
+                "direction": direction,
+                "count": count
+            })
         
         return results
     
-    def _generate_totpay_results(self, card_tot_payment: Dict[str, int], 
-                                card_transactions: Dict[str, List[Dict]]) -> List[Dict]:
+    def _generate_totpay_results(self, card_blocks: Dict[str, int], block_tot_payment: array,
+                                 trx_blocks: array, trx_amounts: array,
+                                 trx_is_cr: bytearray) -> List[Dict]:
         """Generate tot_payment validation results.
         
         Check if tot_payment is 0 but there are CR transactions.
         If CR exists but tot_payment is 0, this is INVALID.
         
         Args:
-            card_tot_payment: Dictionary mapping cards to their tot_payment values
-            card_transactions: Dictionary mapping cards to their transactions
+            card_blocks: Dictionary mapping cards to their latest header block id
+            block_tot_payment: tot_payment value of each header block
+            trx_blocks: Header block id of each transaction
+            trx_amounts: Amount of each transaction
+            trx_is_cr: 1 for each CR transaction, 0 otherwise
             
         Returns:
             List of tot_payment validation result dictionaries
         """
         results = []
         
-        for card, tot_payment in card_tot_payment.items():
-            transactions = card_transactions.get(card, [])
-            cr_transactions = [t for t in transactions if t['direction'] == 'CR']
-            has_cr = len(cr_transactions) > 0
-            cr_total = sum(t['amount'] for t in cr_transactions)
+        block_has_cr, block_cr_total = block_cr_totals(
+            trx_blocks, trx_amounts, trx_is_cr, len(block_tot_payment))
+        block_has_cr = block_has_cr.tolist()
+        block_cr_total = block_cr_total.tolist()
+        
+        for card, block in card_blocks.items():
+            tot_payment = block_tot_payment[block]
+            has_cr = block_has_cr[block]
+            cr_total = block_cr_total[block]
             
             # Determine status: if has CR but tot_payment is 0, it's INVALID
             if has_cr and tot_payment == 0:
@@ -315,44 +793,36 @@ class PTSTMTValidator:
         
         return results
     
-    def _generate_sequence_results(self, customer_sequences: Dict[str, List[str]]) -> List[Dict]:
+    def _generate_sequence_results(self, customer_sequences: Dict[str, List[list]],
+                                   customer_states: Dict[str, int]) -> List[Dict]:
         """Generate sequence validation results.
-        
+
         Valid Pattern: ^01(02(03)*04)((02|03)(03)*04)*$
         This ensures:
         - Starts with 01
         - First block must be: 02 -> (03s) -> 04
         - Subsequent blocks can be: (02 or 03) -> (03s) -> 04
-        
+
+        The pattern is evaluated while scanning by the SEQ_NEXT automaton;
+        a sequence is valid when it ends in SEQ_CLOSED.
+
         Args:
-            customer_sequences: Dictionary mapping customers to their record sequences
-            
+            customer_sequences: Dictionary mapping customers to their [record_type, count] runs
+            customer_states: Dictionary mapping customers to their final automaton state
+
         Returns:
             List of sequence validation result dictionaries
         """
         results = []
-        # Regex for valid structure:
-        # ^01 : Starts with 01
-        # (02(03)*04) : First block must be normal (02..04)
-        # ( : Start of subsequent blocks group
-        #   (02|03) : Block can start with 02 OR 03
-        #   (03)* : Zero or more 03s
-        #   04 : End of block
-        # )* : Repeat subsequent blocks zero or more times
-        # $ : End of string
-        pattern = re.compile(r"^01(02(03)*04)((02|03)(03)*04)*$")
-        
+
         for customer, seq in customer_sequences.items():
-            # Join list into string "01020304..."
-            seq_str = "".join(seq)
-            
             status = "VALID"
-            if not pattern.match(seq_str):
+            if customer_states[customer] != SEQ_CLOSED:
                 status = "INVALID"
             
             results.append({
                 "customer": customer,
-                "sequence": "->".join(seq),
+                "sequence": format_sequence(seq),
                 "status": status
             })
         
@@ -7,16 +7,34 @@ from .data_utils import (
     extract_posting_date,
     extract_card_number,
     to_date,
+    normalize_card,
+    decode_field,
     slice_num,
     slice_str,
-    custom_round
+    parse_num,
+    parse_transaction,
+    transaction_key,
+    custom_round,
+    custom_round_array,
+    CUSTOMER_RECORD,
+    TRANSACTION_RECORD,
+    FIELD_SPANS
 )
 
 __all__ = [
     'extract_posting_date',
     'extract_card_number',
     'to_date',
+    'normalize_card',
+    'decode_field',
     'slice_num',
     'slice_str',
-    'custom_round'
+    'parse_num',
+    'parse_transaction',
+    'transaction_key',
+    'custom_round',
+    'custom_round_array',
+    'CUSTOMER_RECORD',
+    'TRANSACTION_RECORD',
+    'FIELD_SPANS'
 ]
\ No newline at end of file
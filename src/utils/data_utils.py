@@ -4,88 +4,282 @@ Contains utility functions for parsing and extracting data from PTSTMT files.
 """
 
 import datetime
+import struct
+from functools import lru_cache
+from hashlib import blake2b
+from typing import AnyStr, Tuple, Union
 
+import numpy as np
 
-def extract_posting_date(line: str) -> str:
+
+def _record_layout(*fields: tuple) -> struct.Struct:
+    """Build a struct layout from fixed-width field positions.
+    
+    Args:
+        fields: (start, end) pairs with 1-based inclusive positions, as used
+            by slice_num/slice_str, in ascending order
+        
+    Returns:
+        struct.Struct: Layout unpacking each field as raw bytes
+    """
+    fmt = []
+    pos = 0
+    for start, end in fields:
+        if start - 1 > pos:
+            fmt.append(f"{start - 1 - pos}x")
+        fmt.append(f"{end - start + 1}s")
+        pos = end
+    return struct.Struct("".join(fmt))
+
+
+# Field positions, 1-based inclusive as used by slice_num/slice_str
+FIELD_SPANS = {
+    # Customer record (prefix 01)
+    'customer': (3, 18),
+    # Card header (prefix 02) and transaction (prefix 03) records
+    'card': (28, 43),
+    # Card header record
+    'amount_due': (264, 277),
+    'cr_limit': (279, 292),
+    'avl_actual': (294, 308),
+    'prev': (324, 338),
+    'tot_payment': (354, 367),
+    'int': (399, 413),
+    'new_bal': (414, 428),
+    'instl': (891, 900),
+    # Transaction record
+    'posting_date': (82, 89),
+    'trx_detail': (90, 129),
+    'trx_amt': (149, 162),
+    'trx_dir': (163, 164),
+}
+
+# Customer record (prefix 01)
+CUSTOMER_RECORD = _record_layout(FIELD_SPANS['customer'])
+
+# Transaction record (prefix 03)
+TRANSACTION_RECORD = _record_layout(*(FIELD_SPANS[name] for name in (
+    'card', 'posting_date', 'trx_detail', 'trx_amt', 'trx_dir'
+)))
+
+# 0-based slices of the fields returned by the extractors
+_CARD = slice(FIELD_SPANS['card'][0] - 1, FIELD_SPANS['card'][1])
+_POSTING_DATE = slice(FIELD_SPANS['posting_date'][0] - 1, FIELD_SPANS['posting_date'][1])
+
+# Bytes removed by str.strip() from latin-1 text; bytes.strip() alone only
+# removes the ASCII ones
+LATIN1_WHITESPACE = b" \t\n\r\x0b\x0c\x1c\x1d\x1e\x1f\x85\xa0"
+
+
+def _strip_field(field: AnyStr) -> AnyStr:
+    """Strip a field cut from a decoded or raw bytes line the same way."""
+    return field.strip(LATIN1_WHITESPACE) if isinstance(field, bytes) else field.strip()
+
+
+def extract_posting_date(line: AnyStr) -> AnyStr:
     """Extract posting date from a PTSTMT line.
     
     Args:
-        line: A line from PTSTMT file
+        line: A line from PTSTMT file, decoded or raw bytes
         
     Returns:
-        str: Posting date in YYYYMMDD format
+        AnyStr: Posting date in YYYYMMDD format, of the same type as line
     """
-    date_segment = line[75:89]
-    posting_raw = date_segment[6:16]
-    return posting_raw
+    return line[_POSTING_DATE]
 
 
-def extract_card_number(line: str) -> str:
+def extract_card_number(line: AnyStr) -> AnyStr:
     """Extract card number from a PTSTMT line.
     
     Args:
-        line: A line from PTSTMT file
+        line: A line from PTSTMT file, decoded or raw bytes
         
     Returns:
-        str: 16-digit card number
+        AnyStr: 16-digit card number, of the same type as line
     """
-    return line[27:43].strip()
+    return _strip_field(line[_CARD])
 
 
-def to_date(yyyymmdd: str) -> datetime.date:
+@lru_cache(maxsize=4096)
+def to_date(yyyymmdd: Union[str, bytes]) -> datetime.date:
     """Convert YYYYMMDD string to date object.
     
+    Cached, since a statement file repeats a small set of posting dates.
+    
     Args:
-        yyyymmdd: Date string in YYYYMMDD format
+        yyyymmdd: Date string in YYYYMMDD format, or the raw field bytes
         
     Returns:
         datetime.date: Date object
     """
+    if isinstance(yyyymmdd, bytes):
+        yyyymmdd = yyyymmdd.decode("latin-1")
+    
+    # Fixed layout, so build all-digit dates directly instead of running
+    # strptime. int() would also take signs and spaces anywhere, so other
+    # fields (e.g. the space-padded "202511 5") keep strptime's rules
+    if len(yyyymmdd) == 8 and yyyymmdd.isascii() and yyyymmdd.isdigit():
+        return datetime.date(int(yyyymmdd[0:4]), int(yyyymmdd[4:6]), int(yyyymmdd[6:8]))
     return datetime.datetime.strptime(yyyymmdd, "%Y%m%d").date()
 
 
-def slice_num(line: str, start: int, end: int) -> int:
+@lru_cache(maxsize=16384)
+def decode_field(raw: bytes) -> str:
+    """Convert a raw text field to str.
+    
+    Cached, so values repeated across a file (transaction details,
+    directions) decode once and share one str object.
+    
+    Args:
+        raw: Field bytes, as unpacked by TRANSACTION_RECORD
+        
+    Returns:
+        str: Field value without padding
+    """
+    return raw.decode("latin-1").strip()
+
+
+@lru_cache(maxsize=8192)
+def normalize_card(raw: bytes) -> str:
+    """Convert a raw card number field to str.
+    
+    Decoded like decode_field, but cached on its own: a file holds many
+    distinct cards, each repeated only on its header and its transactions,
+    and sharing one cache would let them evict the few transaction details
+    and directions that repeat throughout the file.
+    
+    Args:
+        raw: Raw card number field bytes, as unpacked or gathered from a record
+        
+    Returns:
+        str: Card number without padding
+    """
+    return decode_field.__wrapped__(raw)
+
+
+def slice_num(line: AnyStr, start: int, end: int) -> int:
     """Extract numeric value from line with 1-based indexing.
     
     Handles:
     - Empty fields (returns 0)
+    - Fields that are not all ASCII digits (returns 0)
     - Negative numbers (ending with -)
     - Positive numbers
     
     Args:
-        line: A line from PTSTMT file
+        line: A line from PTSTMT file, decoded or raw bytes
         start: Start position (1-based index)
         end: End position (1-based index)
         
     Returns:
         int: Extracted numeric value
     """
+    if isinstance(line, bytes):
+        return parse_num(line[start-1:end])
+    
     field = line[start-1:end].strip()
     
     if not field:
         return 0
     
+    # str.isdigit() also accepts non-ASCII digits such as "²", which int()
+    # rejects, so the digits are checked with isascii() first (a single
+    # check of the string's storage kind)
+    
     # Handle negative numbers (ending with -)
     if field.endswith("-"):
         num = field[:-1].strip()
+        return -int(num) if num.isascii() and num.isdigit() else 0
+    
+    # Handle positive numbers
+    return int(field) if field.isascii() and field.isdigit() else 0
+
+
+def parse_num(field: bytes) -> int:
+    """Convert a raw fixed-width numeric field to int.
+    
+    Same rules as slice_num, for fields already cut out of a bytes line
+    (e.g. by TRANSACTION_RECORD).
+    
+    Args:
+        field: Raw field bytes
+        
+    Returns:
+        int: Parsed numeric value
+    """
+    field = field.strip(LATIN1_WHITESPACE)
+    
+    if not field:
+        return 0
+    
+    # Handle negative numbers (ending with -)
+    if field.endswith(b"-"):
+        num = field[:-1].strip(LATIN1_WHITESPACE)
         return -int(num) if num.isdigit() else 0
     
     # Handle positive numbers
     return int(field) if field.isdigit() else 0
 
 
-def slice_str(line: str, start: int, end: int) -> str:
+def parse_transaction(line: bytes) -> Tuple[str, datetime.date, str, int, str]:
+    """Parse the fields of a transaction record (prefix 03).
+    
+    Args:
+        line: A raw line from PTSTMT file
+        
+    Returns:
+        Tuple of (card, posting_date, trx_detail, trx_amt, trx_dir)
+    """
+    card, posting, detail, amount, direction = \
+        TRANSACTION_RECORD.unpack_from(line.ljust(TRANSACTION_RECORD.size))
+    return (
+        normalize_card(card),
+        to_date(posting),
+        decode_field(detail),
+        parse_num(amount),
+        decode_field(direction)
+    )
+
+
+def transaction_key(card: str, posting: int, detail: str, amount: int, direction: str) -> int:
+    """Hash transaction fields into a 64-bit duplicate-detection key.
+    
+    Transactions are duplicates when their stripped text fields, posting
+    date and parsed amount are equal, so e.g. a blank amount and
+    "00000000000000" both count as 0, and "20251105" and "202511 5" are
+    the same posting date.
+    
+    Args:
+        card: Card number, as returned by normalize_card
+        posting: Posting date as returned by to_date, in toordinal() form
+        detail: Transaction detail, as returned by decode_field
+        amount: Parsed transaction amount
+        direction: Transaction direction, as returned by decode_field
+        
+    Returns:
+        int: 64-bit key, stable across processes
+    """
+    # Lines cannot contain "\n", so it separates the fields unambiguously
+    text = "\n".join((str(posting), card, detail, direction, str(amount))).encode("latin-1")
+    return int.from_bytes(blake2b(text, digest_size=8).digest(), "little")
+
+
+def slice_str(line: AnyStr, start: int, end: int) -> AnyStr:
     """Extract string value from line with 1-based indexing.
     
     Args:
-        line: A line from PTSTMT file
+        line: A line from PTSTMT file, decoded or raw bytes
         start: Start position (1-based index)
         end: End position (1-based index)
         
     Returns:
-        str: Extracted string value
+        AnyStr: Extracted string value, of the same type as line
     """
-    return line[start-1:end].strip()
+    return _strip_field(line[start-1:end])
+
+
+# Largest magnitude up to which every int converts to float exactly
+_EXACT_FLOAT_INT = 2 ** 53
 
 
 def custom_round(x) -> int:
@@ -101,11 +295,32 @@ def custom_round(x) -> int:
     Returns:
         int: Rounded value, or original value if not numeric
     """
-    try:
-        x = float(x)
-    except (ValueError, TypeError):
+    # Ints that float() represents exactly are already rounded
+    if type(x) is int and -_EXACT_FLOAT_INT <= x <= _EXACT_FLOAT_INT:
         return x
     
+    if type(x) is not float:
+        try:
+            x = float(x)
+        except (ValueError, TypeError):
+            return x
+    
     integer = int(x)
-    decimal = x - integer
-    return integer + 1 if decimal >= 0.5 else integer
\ No newline at end of file
+    return integer + 1 if x - integer >= 0.5 else integer
+
+
+def custom_round_array(values) -> np.ndarray:
+    """Vectorized custom_round for arrays of numbers.
+    
+    Same rule as custom_round: .5 and above rounds up, and the fractional
+    part of negative numbers is truncated.
+    
+    Args:
+        values: Array-like of numbers
+        
+    Returns:
+        np.ndarray: int64 rounded values
+    """
+    values = np.asarray(values, dtype=np.float64)
+    integer = np.trunc(values)
+    return (integer + (values - integer >= 0.5)).astype(np.int64)